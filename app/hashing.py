@@ -2,6 +2,9 @@ import hashlib
 import os
 import time
 
+# Algorithm used for the algorithm-tagged ``fingerprint`` column.
+FINGERPRINT_ALGORITHM = 'sha256'
+
 def select_hashing_algorithm(file_size):
     if file_size < 1024 * 1024:  # Less than 1MB
         return 'md5'
@@ -9,24 +12,50 @@ def select_hashing_algorithm(file_size):
         return 'sha1'
     else:
         return 'sha256'
-    
+
+def format_fingerprint(algorithm, hexdigest):
+    """Tag a hex digest with the algorithm that produced it, e.g. 'sha256:ab12...'."""
+    return f"{algorithm}:{hexdigest}"
+
+def parse_fingerprint(fingerprint):
+    """Split a tagged fingerprint into (algorithm, hexdigest)."""
+    algorithm, _, hexdigest = fingerprint.partition(':')
+    if not hexdigest:
+        raise ValueError(f"Untagged fingerprint: {fingerprint!r}")
+    return algorithm, hexdigest
+
 def generate_checksum(file_path):
+    """Legacy size-based checksum of a file, or None if it cannot be read."""
+    return generate_checksums(file_path)[0]
+
+def generate_checksums(file_path, algorithm=FINGERPRINT_ALGORITHM):
+    """Return (legacy checksum, tagged fingerprint) computed in a single read.
+
+    The legacy checksum uses the size-based algorithm from
+    select_hashing_algorithm so it stays comparable with existing rows.
+    Returns (None, None) if the file cannot be read.
+    """
     retries = 3
     for attempt in range(retries):
         try:
             file_size = os.path.getsize(file_path)
-            algorithm = select_hashing_algorithm(file_size)
-            hash_func = getattr(hashlib, algorithm)()
+            legacy_algorithm = select_hashing_algorithm(file_size)
+            legacy_func = getattr(hashlib, legacy_algorithm)()
+            if algorithm == legacy_algorithm:
+                fingerprint_func = legacy_func
+            else:
+                fingerprint_func = hashlib.new(algorithm)
             with open(file_path, 'rb') as f:
-                for chunk in iter(lambda: f.read(4096), b""):
-                    hash_func.update(chunk)
-            # Return the checksum if successful
-            return hash_func.hexdigest()
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    legacy_func.update(chunk)
+                    if fingerprint_func is not legacy_func:
+                        fingerprint_func.update(chunk)
+            return (legacy_func.hexdigest(),
+                    format_fingerprint(algorithm, fingerprint_func.hexdigest()))
         except PermissionError as e:
             print(f"Attempt {attempt + 1}: PermissionError: {e}")
             time.sleep(1)  # Wait before retrying
         except Exception as e:
             print(f"An error occurred: {e}")
-            return None
-    # Return None if all attempts fail
-    return None
\ No newline at end of file
+            return None, None
+    return None, None
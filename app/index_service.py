@@ -0,0 +1,258 @@
+import bisect
+import hashlib
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+from collections import OrderedDict
+
+from app.hashing import parse_fingerprint
+
+logger = logging.getLogger(__name__)
+
+# Protocol: one JSON object per line over a persistent TCP connection.
+#   request:  {"op": "lookup_insert" | "lookup", "items": [{"fingerprint", "host", "file_path", "file_size"}, ...]}
+#   response: {"results": [{"fingerprint", "owner": {"host", "file_path", "file_size"} | null}, ...]}
+# The owner of a fingerprint is the first host that inserted it; it never
+# changes afterwards, which is what makes client-side caching safe.
+
+def parse_shards(value):
+    """Parse 'host:port,host:port' into a list of (host, port) tuples."""
+    shards = []
+    for item in value.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        host, _, port = item.rpartition(':')
+        shards.append((host or 'localhost', int(port)))
+    return shards
+
+class HashRing:
+    """Consistent-hash ring keyed on the leading bytes of the fingerprint digest."""
+
+    def __init__(self, shards, replicas=64):
+        self.shards = list(shards)
+        self.points = []
+        for shard in self.shards:
+            for i in range(replicas):
+                digest = hashlib.md5(f"{shard[0]}:{shard[1]}#{i}".encode()).hexdigest()
+                self.points.append((int(digest[:8], 16), shard))
+        self.points.sort()
+        self.keys = [point for point, _ in self.points]
+
+    def shard_for(self, fingerprint):
+        # Digests are already uniformly distributed, so the prefix is the ring position
+        _, hexdigest = parse_fingerprint(fingerprint)
+        position = int(hexdigest[:8], 16)
+        index = bisect.bisect(self.keys, position) % len(self.points)
+        return self.points[index][1]
+
+class IndexStore:
+    """In-memory fingerprint -> owner map for one shard, with an optional append-only log."""
+
+    def __init__(self, log_path=None):
+        self.owners = {}
+        self.lock = threading.Lock()
+        self.log_file = None
+        if log_path:
+            self.replay(log_path)
+            self.log_file = open(log_path, 'a')
+
+    def replay(self, log_path):
+        if not os.path.exists(log_path):
+            return
+        with open(log_path, 'r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # Torn last line after a crash
+                self.owners.setdefault(entry['fingerprint'], entry['owner'])
+        logger.info(f"Replayed {len(self.owners)} fingerprints from {log_path}")
+
+    def handle(self, op, items):
+        results = []
+        with self.lock:
+            for item in items:
+                fingerprint = item['fingerprint']
+                owner = self.owners.get(fingerprint)
+                if owner is None and op == 'lookup_insert':
+                    new_owner = {
+                        'host': item['host'],
+                        'file_path': item['file_path'],
+                        'file_size': item['file_size'],
+                    }
+                    self.owners[fingerprint] = new_owner
+                    if self.log_file:
+                        self.log_file.write(json.dumps({'fingerprint': fingerprint, 'owner': new_owner}) + '\n')
+                results.append({'fingerprint': fingerprint, 'owner': owner})
+            if self.log_file:
+                self.log_file.flush()
+        return results
+
+class IndexRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                op = request.get('op')
+                if op in ('lookup', 'lookup_insert'):
+                    response = {'results': self.server.store.handle(op, request['items'])}
+                elif op == 'stats':
+                    response = {'fingerprints': len(self.server.store.owners)}
+                else:
+                    response = {'error': f"Unknown op: {op}"}
+            except (ValueError, KeyError, TypeError) as e:
+                response = {'error': f"Bad request: {str(e)}"}
+            self.wfile.write(json.dumps(response).encode() + b'\n')
+            self.wfile.flush()
+
+class IndexShardServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, log_path=None):
+        self.store = IndexStore(log_path)
+        super().__init__(address, IndexRequestHandler)
+
+def run_shard(host, port, log_path=None):
+    """Serve one index shard until interrupted."""
+    with IndexShardServer((host, port), log_path) as server:
+        logger.info(f"Index shard listening on {host}:{port}")
+        server.serve_forever()
+
+class IndexClient:
+    """Client for a set of index shards with a local read-through LRU cache.
+
+    Batches are split by shard, written to every shard before any response is
+    read so the shards work in parallel, and owners returned by the service
+    are cached so repeated lookups of the same fingerprint stay local.
+    """
+
+    def __init__(self, shards, host_id=None, cache_size=100000, timeout=5.0):
+        self.ring = HashRing(shards)
+        self.host_id = host_id or socket.gethostname()
+        self.cache_size = cache_size
+        self.timeout = timeout
+        self.cache = OrderedDict()
+        self.connections = {}
+        self.lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    @classmethod
+    def from_config(cls, app):
+        shards = parse_shards(app.config['INDEX_SERVICE_SHARDS'])
+        if not shards:
+            return None
+        return cls(shards, host_id=app.config['INDEX_HOST_ID'],
+                   cache_size=app.config['INDEX_CACHE_SIZE'])
+
+    def connection(self, shard):
+        conn = self.connections.get(shard)
+        if conn is None:
+            sock = socket.create_connection(shard, timeout=self.timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            conn = (sock, sock.makefile('rb'))
+            self.connections[shard] = conn
+        return conn
+
+    def drop_connection(self, shard):
+        conn = self.connections.pop(shard, None)
+        if conn:
+            conn[1].close()
+            conn[0].close()
+
+    def cache_get(self, fingerprint):
+        owner = self.cache.get(fingerprint)
+        if owner is not None:
+            self.cache.move_to_end(fingerprint)
+        return owner
+
+    def cache_put(self, fingerprint, owner):
+        self.cache[fingerprint] = owner
+        self.cache.move_to_end(fingerprint)
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def send_batches(self, op, batches):
+        """Pipeline one request per shard, then collect the responses per shard."""
+        for shard, items in batches.items():
+            request = json.dumps({'op': op, 'items': items}).encode() + b'\n'
+            try:
+                self.connection(shard)[0].sendall(request)
+            except OSError:
+                # Stale connection: reconnect once
+                self.drop_connection(shard)
+                self.connection(shard)[0].sendall(request)
+
+        results = {}
+        for shard in batches:
+            line = self.connection(shard)[1].readline()
+            if not line:
+                raise ConnectionError(f"Index shard {shard[0]}:{shard[1]} closed the connection")
+            response = json.loads(line)
+            if 'error' in response:
+                raise RuntimeError(f"Index shard {shard[0]}:{shard[1]}: {response['error']}")
+            results[shard] = response['results']
+        return results
+
+    def lookup_insert(self, items, insert=True):
+        """Look up (and by default register) a batch of files.
+
+        ``items`` are dicts with fingerprint, file_path and file_size. Returns
+        a list of owners aligned with ``items``; an owner is None when the
+        fingerprint was unknown to the service (and, with ``insert``, has
+        just been registered to this host).
+        """
+        owners = [None] * len(items)
+        batches = {}
+        positions = {}
+        with self.lock:
+            for index, item in enumerate(items):
+                owner = self.cache_get(item['fingerprint'])
+                if owner is not None:
+                    self.cache_hits += 1
+                    owners[index] = owner
+                    continue
+                self.cache_misses += 1
+                shard = self.ring.shard_for(item['fingerprint'])
+                batches.setdefault(shard, []).append({
+                    'fingerprint': item['fingerprint'],
+                    'host': self.host_id,
+                    'file_path': item['file_path'],
+                    'file_size': item['file_size'],
+                })
+                positions.setdefault(shard, []).append(index)
+
+            if not batches:
+                return owners
+            try:
+                results = self.send_batches('lookup_insert' if insert else 'lookup', batches)
+            except (OSError, ValueError, RuntimeError):
+                # Connections may hold unread responses; start clean next time
+                for shard in list(self.connections):
+                    self.drop_connection(shard)
+                raise
+
+            for shard, shard_results in results.items():
+                for index, sent, result in zip(positions[shard], batches[shard], shard_results):
+                    owner = result['owner']
+                    owners[index] = owner
+                    if owner is None and insert:
+                        # Our own registration: we own this fingerprint from now on
+                        owner = {key: sent[key] for key in ('host', 'file_path', 'file_size')}
+                    if owner is not None:
+                        self.cache_put(result['fingerprint'], owner)
+        return owners
+
+    def is_foreign(self, owner, file_path):
+        """True if ``owner`` is a different file than ``file_path`` on this host."""
+        return owner is not None and (owner['host'] != self.host_id or owner['file_path'] != file_path)
+
+    def close(self):
+        with self.lock:
+            for shard in list(self.connections):
+                self.drop_connection(shard)
@@ -1,10 +1,97 @@
+from sqlalchemy import event
+from sqlalchemy.dialects import mysql, postgresql, sqlite
 from app import db
 
 class FileRecord(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    checksum = db.Column(db.String(64), unique=True, nullable=False)
+    # Not unique: kept duplicates are recorded so they can be reported on
+    checksum = db.Column(db.String(64), nullable=False, index=True)
+    # Algorithm-tagged digest ("sha256:<hex>"); NULL until the row is re-keyed
+    fingerprint = db.Column(db.String(160), nullable=True, index=True)
     file_name = db.Column(db.String(256), nullable=False)
     file_path = db.Column(db.String(512), nullable=False)
     file_size = db.Column(db.BigInteger, nullable=False)  # Ensure this is BigInteger for large files
     file_type = db.Column(db.String(20), nullable=False)  # Increase length to 20
-    date_created = db.Column(db.DateTime, nullable=False, default=db.func.current_timestamp())
\ No newline at end of file
+    date_created = db.Column(db.DateTime, nullable=False, default=db.func.current_timestamp())
+
+    @property
+    def group_key(self):
+        """Key of the duplicate group this row belongs to (legacy checksum until re-keyed)."""
+        return self.fingerprint or self.checksum
+
+    @classmethod
+    def find_duplicate(cls, checksum, fingerprint=None, exclude_path=None):
+        """Dual-read lookup used while rows are being re-keyed.
+
+        Re-keyed rows are matched on the tagged fingerprint; rows the
+        background migration has not reached yet are still matched on the
+        legacy checksum. Rows for ``exclude_path`` are ignored so a file is
+        never reported as a duplicate of itself.
+        """
+        for column, value in ((cls.fingerprint, fingerprint), (cls.checksum, checksum)):
+            if not value:
+                continue
+            query = cls.query.filter(column == value)
+            if exclude_path:
+                query = query.filter(cls.file_path != exclude_path)
+            record = query.order_by(cls.id).first()
+            if record:
+                return record
+        return None
+
+class DuplicateGroup(db.Model):
+    """Cached per-content aggregates, maintained incrementally as FileRecords change."""
+    group_key = db.Column(db.String(160), primary_key=True)
+    file_size = db.Column(db.BigInteger, nullable=False)  # Size of one copy
+    file_count = db.Column(db.Integer, nullable=False)
+    total_bytes = db.Column(db.BigInteger, nullable=False)
+    wasted_bytes = db.Column(db.BigInteger, nullable=False, index=True)  # Bytes beyond the first copy
+
+# Dialect-specific INSERT constructs that support upserts
+UPSERT_INSERTS = {
+    'mysql': mysql.insert,
+    'mariadb': mysql.insert,
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+def add_to_group(connection, group_key, file_size):
+    """Count one more copy of ``group_key`` in the duplicate_group aggregates.
+
+    Done as a single upsert: the monitor thread and the rekey thread can add
+    the first copy of the same group at once, and a separate UPDATE then
+    INSERT would let both insert and one fail on the primary key.
+    """
+    groups = DuplicateGroup.__table__
+    statement = UPSERT_INSERTS[connection.dialect.name](groups).values(
+        group_key=group_key, file_size=file_size, file_count=1,
+        total_bytes=file_size, wasted_bytes=0)
+    increments = dict(file_count=groups.c.file_count + 1,
+                      total_bytes=groups.c.total_bytes + file_size,
+                      wasted_bytes=groups.c.wasted_bytes + file_size)
+    if connection.dialect.name in ('mysql', 'mariadb'):
+        statement = statement.on_duplicate_key_update(**increments)
+    else:
+        statement = statement.on_conflict_do_update(index_elements=[groups.c.group_key], set_=increments)
+    connection.execute(statement)
+
+def remove_from_group(connection, group_key, file_size):
+    """Count one copy of ``group_key`` less, dropping the group with its last copy."""
+    groups = DuplicateGroup.__table__
+    result = connection.execute(
+        groups.update()
+        .where(groups.c.group_key == group_key)
+        .where(groups.c.file_count > 1)
+        .values(file_count=groups.c.file_count - 1,
+                total_bytes=groups.c.total_bytes - file_size,
+                wasted_bytes=groups.c.wasted_bytes - file_size))
+    if result.rowcount == 0:
+        connection.execute(groups.delete().where(groups.c.group_key == group_key))
+
+@event.listens_for(FileRecord, 'after_insert')
+def file_record_inserted(mapper, connection, target):
+    add_to_group(connection, target.group_key, target.file_size)
+
+@event.listens_for(FileRecord, 'after_delete')
+def file_record_deleted(mapper, connection, target):
+    remove_from_group(connection, target.group_key, target.file_size)
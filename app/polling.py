@@ -0,0 +1,196 @@
+import logging
+import os
+import threading
+import time
+from array import array
+
+from watchdog.events import FileCreatedEvent, FileModifiedEvent, FileMovedEvent
+
+logger = logging.getLogger(__name__)
+
+class DirectorySnapshot:
+    """Entries of one directory as sorted names plus parallel fixed-width arrays.
+
+    Keeping (inode, size, mtime) in typed arrays instead of per-file objects
+    keeps a snapshot of a few hundred thousand entries to a few MB.
+    """
+    __slots__ = ('names', 'inodes', 'sizes', 'mtimes', 'subdirs')
+
+    def __init__(self):
+        self.names = []
+        self.inodes = array('Q')
+        self.sizes = array('q')
+        self.mtimes = array('q')
+        self.subdirs = []
+
+    @classmethod
+    def scan(cls, path):
+        """Read a directory once with os.scandir and return its snapshot."""
+        entries = []
+        snapshot = cls()
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir():
+                        snapshot.subdirs.append(entry.path)
+                        continue
+                    st = entry.stat()
+                    entries.append((entry.name, entry.inode(), st.st_size, st.st_mtime_ns))
+                except OSError:
+                    # Entry vanished or is unreadable between readdir and stat
+                    continue
+        entries.sort()
+        for name, inode, size, mtime in entries:
+            snapshot.names.append(name)
+            snapshot.inodes.append(inode)
+            snapshot.sizes.append(size)
+            snapshot.mtimes.append(mtime)
+        return snapshot
+
+    def diff(self, newer):
+        """Merge-walk two sorted snapshots.
+
+        Returns (created, deleted, modified) where created and deleted are
+        lists of (name, inode) and modified is a list of names.
+        """
+        created, deleted, modified = [], [], []
+        i = j = 0
+        old_count, new_count = len(self.names), len(newer.names)
+        while i < old_count or j < new_count:
+            if j >= new_count or (i < old_count and self.names[i] < newer.names[j]):
+                deleted.append((self.names[i], self.inodes[i]))
+                i += 1
+            elif i >= old_count or newer.names[j] < self.names[i]:
+                created.append((newer.names[j], newer.inodes[j]))
+                j += 1
+            else:
+                if self.inodes[i] != newer.inodes[j]:
+                    # Same name, different file: the old one was replaced
+                    deleted.append((self.names[i], self.inodes[i]))
+                    created.append((newer.names[j], newer.inodes[j]))
+                elif self.sizes[i] != newer.sizes[j] or self.mtimes[i] != newer.mtimes[j]:
+                    modified.append(newer.names[j])
+                i += 1
+                j += 1
+        return created, deleted, modified
+
+class DirectoryState:
+    __slots__ = ('path', 'snapshot', 'interval', 'next_due')
+
+    def __init__(self, path, interval):
+        self.path = path
+        self.snapshot = None
+        self.interval = interval
+        self.next_due = 0.0
+
+class Watch:
+    __slots__ = ('event_handler', 'root', 'recursive', 'directories')
+
+    def __init__(self, event_handler, root, recursive):
+        self.event_handler = event_handler
+        self.root = root
+        self.recursive = recursive
+        self.directories = {}
+
+class ScandirPollingObserver(threading.Thread):
+    """Polling replacement for watchdog's Observer on NFS/SMB mounts.
+
+    Each directory is read at most once per cycle. Directories that changed
+    on their last poll are polled every ``min_interval`` seconds; quiet ones
+    back off by doubling up to ``max_interval``. Differences between
+    successive snapshots are dispatched to the handler as the same created,
+    modified and moved events watchdog would produce.
+    """
+
+    def __init__(self, min_interval=1.0, max_interval=30.0):
+        super().__init__(name='scandir-poller', daemon=True)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.watches = []
+        self.stop_event = threading.Event()
+
+    def schedule(self, event_handler, path, recursive=False):
+        """Watch ``path`` for ``event_handler``, mirroring Observer.schedule."""
+        watch = Watch(event_handler, os.path.abspath(path), recursive)
+        watch.directories[watch.root] = DirectoryState(watch.root, self.min_interval)
+        self.watches.append(watch)
+
+    def run(self):
+        # Baseline snapshots: existing files are not reported as created
+        for watch in self.watches:
+            self.poll_directory(watch, watch.directories[watch.root], emit=False)
+
+        while not self.stop_event.is_set():
+            for watch in self.watches:
+                try:
+                    self.poll_cycle(watch)
+                except Exception as e:
+                    logger.error(f"Error polling watched directories: {str(e)}")
+            self.stop_event.wait(self.min_interval)
+
+    def poll_cycle(self, watch):
+        """Poll every directory that is due and dispatch the resulting events."""
+        now = time.monotonic()
+        created, deleted = [], []
+        for state in list(watch.directories.values()):
+            if state.next_due > now:
+                continue
+            changes = self.poll_directory(watch, state, emit=True)
+            if changes:
+                created.extend(changes[0])
+                deleted.extend(changes[1])
+
+        # A deletion and a creation with the same inode within one cycle is a rename
+        moved_from = {inode: path for path, inode in deleted if inode}
+        for path, inode in created:
+            src_path = moved_from.pop(inode, None) if inode else None
+            if src_path is not None:
+                watch.event_handler.dispatch(FileMovedEvent(src_path, path))
+            else:
+                watch.event_handler.dispatch(FileCreatedEvent(path))
+
+    def poll_directory(self, watch, state, emit):
+        """Rescan one directory; returns (created, deleted) as (path, inode) lists."""
+        try:
+            snapshot = DirectorySnapshot.scan(state.path)
+        except FileNotFoundError:
+            if state.path != watch.root:
+                del watch.directories[state.path]
+            return None
+        except OSError as e:
+            logger.warning(f"Cannot read directory {state.path}: {str(e)}")
+            state.next_due = time.monotonic() + state.interval
+            return None
+
+        if watch.recursive:
+            for subdir in snapshot.subdirs:
+                if subdir not in watch.directories:
+                    # New subdirectories are picked up on the next cycle,
+                    # so their contents are reported as created then.
+                    sub_state = DirectoryState(subdir, self.min_interval)
+                    watch.directories[subdir] = sub_state
+                    if not emit:
+                        self.poll_directory(watch, sub_state, emit=False)
+                    else:
+                        sub_state.snapshot = DirectorySnapshot()
+
+        previous, state.snapshot = state.snapshot, snapshot
+        if previous is None or not emit:
+            state.next_due = time.monotonic() + state.interval
+            return None
+
+        created, deleted, modified = previous.diff(snapshot)
+        for name in modified:
+            watch.event_handler.dispatch(FileModifiedEvent(os.path.join(state.path, name)))
+
+        if created or deleted or modified:
+            state.interval = self.min_interval
+        else:
+            state.interval = min(state.interval * 2, self.max_interval)
+        state.next_due = time.monotonic() + state.interval
+
+        return ([(os.path.join(state.path, name), inode) for name, inode in created],
+                [(os.path.join(state.path, name), inode) for name, inode in deleted])
+
+    def stop(self):
+        self.stop_event.set()
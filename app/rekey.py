@@ -0,0 +1,188 @@
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from app import db
+from app.hashing import FINGERPRINT_ALGORITHM, generate_checksums
+from app.models import FileRecord, add_to_group, remove_from_group
+
+logger = logging.getLogger(__name__)
+
+class RekeyMigration:
+    """Online migration of FileRecord rows onto the tagged ``fingerprint`` column.
+
+    Rows are walked in primary-key order (keyset pagination), each batch is
+    re-hashed by a small thread pool and written back in one commit, and the
+    last processed id is checkpointed to disk so an interrupted run resumes
+    where it stopped. Lookups keep working throughout via
+    FileRecord.find_duplicate, which falls back to the legacy checksum.
+    Rows it fingerprints are also appended to the fingerprint snapshot, if
+    one is given. Rows whose file is gone or changed can't be re-keyed; their
+    ids are kept in the checkpoint and they stay reachable only through the
+    legacy checksum, so the pass is only marked complete when none are left.
+    """
+
+    def __init__(self, app, algorithm=FINGERPRINT_ALGORITHM, batch_size=200,
+                 workers=4, throttle_seconds=1.0, checkpoint_path='rekey_checkpoint.json',
+                 snapshot=None):
+        self.app = app
+        self.snapshot = snapshot
+        self.algorithm = algorithm
+        self.batch_size = batch_size
+        self.workers = workers
+        self.throttle_seconds = throttle_seconds
+        self.checkpoint_path = checkpoint_path
+        self.stop_event = threading.Event()
+        self.checkpoint = self.load_checkpoint()
+
+    @classmethod
+    def from_config(cls, app, snapshot=None):
+        return cls(
+            app,
+            batch_size=app.config['REKEY_BATCH_SIZE'],
+            workers=app.config['REKEY_WORKERS'],
+            throttle_seconds=app.config['REKEY_THROTTLE_SECONDS'],
+            checkpoint_path=app.config['REKEY_CHECKPOINT_PATH'],
+            snapshot=snapshot,
+        )
+
+    def load_checkpoint(self):
+        """Load progress from disk, starting over if the target algorithm changed."""
+        fresh = {'algorithm': self.algorithm, 'last_id': 0, 'rekeyed': 0, 'skipped': 0,
+                 'skipped_ids': [], 'complete': False}
+        try:
+            with open(self.checkpoint_path, 'r') as f:
+                checkpoint = json.load(f)
+        except FileNotFoundError:
+            return fresh
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable rekey checkpoint {self.checkpoint_path}: {str(e)}")
+            return fresh
+        if checkpoint.get('algorithm') != self.algorithm:
+            logger.info(f"Rekey target changed to {self.algorithm}, restarting from the first record")
+            return fresh
+        checkpoint.setdefault('skipped_ids', [])
+        return checkpoint
+
+    def save_checkpoint(self):
+        """Write the checkpoint atomically so a crash never leaves a torn file."""
+        self.checkpoint['updated_at'] = datetime.now().isoformat()
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.checkpoint, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def not_rekeyed(self):
+        """Query for rows that are not yet keyed with the target algorithm."""
+        prefix = f"{self.algorithm}:"
+        return FileRecord.query.filter(db.or_(FileRecord.fingerprint.is_(None),
+                                              ~FileRecord.fingerprint.startswith(prefix)))
+
+    def next_batch(self):
+        """Fetch the next batch of rows that are not yet keyed with the target algorithm."""
+        return (self.not_rekeyed()
+                .filter(FileRecord.id > self.checkpoint['last_id'])
+                .order_by(FileRecord.id)
+                .limit(self.batch_size)
+                .with_entities(FileRecord.id, FileRecord.file_path, FileRecord.checksum,
+                               FileRecord.fingerprint, FileRecord.file_size)
+                .all())
+
+    def rehash(self, row):
+        """Hash one file; returns (row, new fingerprint) or None if it can't be re-keyed."""
+        record_id, file_path, checksum, _, _ = row
+        if not os.path.exists(file_path):
+            logger.info(f"Rekey skipped, file no longer exists: {file_path}")
+            return None
+        legacy_checksum, fingerprint = generate_checksums(file_path, self.algorithm)
+        if legacy_checksum is None:
+            return None
+        if legacy_checksum != checksum:
+            # The file on disk is no longer the content this row describes
+            logger.warning(f"Rekey skipped, content changed since it was recorded: {file_path}")
+            return None
+        return row, fingerprint
+
+    def run_batch(self, rows):
+        """Re-hash one batch in parallel and commit the new fingerprints together."""
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            results = list(executor.map(self.rehash, rows))
+
+        rekeyed = 0
+        snapshot_entries = []
+        skipped_ids = []
+        for row, result in zip(rows, results):
+            if result is None:
+                skipped_ids.append(row[0])
+                continue
+            (record_id, _, checksum, old_fingerprint, file_size), fingerprint = result
+            # Guard on the checksum so a concurrently replaced row is left alone
+            updated = (FileRecord.query
+                       .filter_by(id=record_id, checksum=checksum)
+                       .update({'fingerprint': fingerprint}, synchronize_session=False))
+            if updated:
+                # Bulk updates bypass the ORM events, so move the row's group by hand
+                connection = db.session.connection()
+                remove_from_group(connection, old_fingerprint or checksum, file_size)
+                add_to_group(connection, fingerprint, file_size)
+                snapshot_entries.append((file_size, fingerprint, record_id))
+            else:
+                skipped_ids.append(record_id)
+            rekeyed += updated
+        db.session.commit()
+
+        if self.snapshot:
+            for file_size, fingerprint, record_id in snapshot_entries:
+                self.snapshot.append(file_size, fingerprint, record_id)
+
+        self.checkpoint['last_id'] = rows[-1][0]
+        self.checkpoint['rekeyed'] += rekeyed
+        self.checkpoint['skipped'] += len(rows) - rekeyed
+        self.checkpoint['skipped_ids'].extend(skipped_ids)
+        self.save_checkpoint()
+        return rekeyed
+
+    def run(self):
+        """Process batches until every row is re-keyed or stop() is called."""
+        logger.info(f"Starting fingerprint rekey to {self.algorithm} from record id {self.checkpoint['last_id']}")
+        with self.app.app_context():
+            while not self.stop_event.is_set():
+                try:
+                    rows = self.next_batch()
+                    if not rows:
+                        break
+                    rekeyed = self.run_batch(rows)
+                    logger.info(f"Rekeyed {rekeyed}/{len(rows)} records up to id {self.checkpoint['last_id']} "
+                                f"(total rekeyed: {self.checkpoint['rekeyed']}, skipped: {self.checkpoint['skipped']})")
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error(f"Error during fingerprint rekey: {str(e)}")
+                # Throttle between batches so the monitor keeps priority on disk and database
+                self.stop_event.wait(self.throttle_seconds)
+            else:
+                logger.info("Fingerprint rekey paused")
+                return
+            # Skipped rows are behind last_id and never retried by this pass
+            remaining = self.not_rekeyed().count()
+        self.checkpoint['complete'] = remaining == 0
+        self.save_checkpoint()
+        if remaining:
+            logger.warning(f"Fingerprint rekey finished with {remaining} records still keyed by legacy "
+                           f"checksum; dual-read lookups stay on for them (skipped ids are in "
+                           f"{self.checkpoint_path})")
+        else:
+            logger.info(f"Fingerprint rekey complete: {self.checkpoint['rekeyed']} rekeyed, "
+                        f"{self.checkpoint['skipped']} skipped")
+
+    def stop(self):
+        self.stop_event.set()
+
+def start_rekey_thread(app, snapshot=None):
+    """Run the rekey migration in a daemon thread; returns the migration so it can be stopped."""
+    migration = RekeyMigration.from_config(app, snapshot)
+    thread = threading.Thread(target=migration.run, name='fingerprint-rekey', daemon=True)
+    thread.start()
+    return migration
@@ -0,0 +1,106 @@
+import csv
+import io
+import json
+
+from app import db
+from app.models import DuplicateGroup, FileRecord
+
+CSV_COLUMNS = ['group_key', 'file_count', 'file_size', 'wasted_bytes',
+               'file_id', 'file_path', 'date_created']
+
+def iter_group_pages(min_count=2, page_size=500, limit=None):
+    """Yield pages of DuplicateGroup rows ranked by wasted bytes.
+
+    Pages are fetched with keyset pagination on (wasted_bytes DESC,
+    group_key ASC), so each page is an index range scan no matter how deep
+    into the ranking the export is.
+    """
+    last = None
+    remaining = limit
+    while remaining is None or remaining > 0:
+        query = DuplicateGroup.query.filter(DuplicateGroup.file_count >= min_count)
+        if last is not None:
+            query = query.filter(db.or_(
+                DuplicateGroup.wasted_bytes < last.wasted_bytes,
+                db.and_(DuplicateGroup.wasted_bytes == last.wasted_bytes,
+                        DuplicateGroup.group_key > last.group_key)))
+        size = page_size if remaining is None else min(page_size, remaining)
+        page = (query.order_by(DuplicateGroup.wasted_bytes.desc(), DuplicateGroup.group_key)
+                .limit(size)
+                .all())
+        if not page:
+            return
+        yield page
+        last = page[-1]
+        if remaining is not None:
+            remaining -= len(page)
+
+def iter_group_files(keys, yield_per=1000):
+    """Stream the FileRecords belonging to the given group keys via a server-side cursor."""
+    query = (FileRecord.query
+             .filter(db.or_(FileRecord.fingerprint.in_(keys),
+                            db.and_(FileRecord.fingerprint.is_(None),
+                                    FileRecord.checksum.in_(keys))))
+             .order_by(FileRecord.id)
+             .execution_options(stream_results=True)
+             .yield_per(yield_per))
+    for record in query:
+        yield record
+
+def iter_duplicate_groups(min_count=2, page_size=500, limit=None):
+    """Yield (group, files) pairs in ranking order, one page of groups in memory at a time."""
+    for page in iter_group_pages(min_count, page_size, limit):
+        files = {group.group_key: [] for group in page}
+        for record in iter_group_files(list(files)):
+            files[record.group_key].append({
+                'id': record.id,
+                'file_path': record.file_path,
+                'date_created': record.date_created.isoformat(),
+            })
+        for group in page:
+            yield group, files[group.group_key]
+
+def stream_csv(groups):
+    """Render (group, files) pairs as CSV text chunks, one row per file."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    for group, files in groups:
+        for file in files:
+            writer.writerow([group.group_key, group.file_count, group.file_size, group.wasted_bytes,
+                             file['id'], file['file_path'], file['date_created']])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+def stream_jsonl(groups):
+    """Render (group, files) pairs as JSON lines, one object per group."""
+    for group, files in groups:
+        yield json.dumps({
+            'group_key': group.group_key,
+            'file_count': group.file_count,
+            'file_size': group.file_size,
+            'wasted_bytes': group.wasted_bytes,
+            'files': files,
+        }) + '\n'
+
+REPORT_FORMATS = {
+    'csv': (stream_csv, 'text/csv'),
+    'jsonl': (stream_jsonl, 'application/x-ndjson'),
+}
+
+def rebuild_duplicate_groups():
+    """Recompute every aggregate from file_record; only needed to repair drift."""
+    group_key = db.func.coalesce(FileRecord.fingerprint, FileRecord.checksum)
+    totals = (db.select(group_key,
+                        db.func.max(FileRecord.file_size),
+                        db.func.count(FileRecord.id),
+                        db.func.sum(FileRecord.file_size),
+                        db.func.sum(FileRecord.file_size) - db.func.max(FileRecord.file_size))
+              .group_by(group_key))
+    groups = DuplicateGroup.__table__
+    db.session.execute(groups.delete())
+    db.session.execute(groups.insert().from_select(
+        ['group_key', 'file_size', 'file_count', 'total_bytes', 'wasted_bytes'], totals))
+    db.session.commit()
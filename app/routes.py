@@ -1,7 +1,58 @@
-from flask import Blueprint, render_template
+from flask import Blueprint, Response, abort, current_app, jsonify, render_template, request, stream_with_context
+from app.models import FileRecord
+from app.reports import REPORT_FORMATS, iter_duplicate_groups
+from app.snapshot import FingerprintSnapshot
 
 bp = Blueprint('main', __name__)
 
 @bp.route('/', methods=['GET'])
 def index():
-    return render_template('index.html')
\ No newline at end of file
+    top_groups = iter_duplicate_groups(limit=10)
+    return render_template('index.html', top_groups=list(top_groups))
+
+@bp.route('/reports/duplicates', methods=['GET'])
+def duplicates_report():
+    """Stream duplicate groups ranked by wasted bytes as CSV or JSON lines."""
+    fmt = request.args.get('format', 'csv')
+    if fmt not in REPORT_FORMATS:
+        abort(400, description=f"Unsupported format: {fmt}")
+    min_count = request.args.get('min_count', 2, type=int)
+    limit = request.args.get('limit', type=int)
+    render, mimetype = REPORT_FORMATS[fmt]
+    groups = iter_duplicate_groups(min_count=min_count, limit=limit)
+    return Response(stream_with_context(render(groups)), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename=duplicates.{fmt}'})
+
+def get_snapshot():
+    """Map the shared fingerprint snapshot once per app process."""
+    snapshot = current_app.extensions.get('fingerprint_snapshot')
+    if snapshot is None:
+        snapshot = FingerprintSnapshot.from_config(current_app)
+        current_app.extensions['fingerprint_snapshot'] = snapshot
+    return snapshot
+
+@bp.route('/api/lookup', methods=['GET'])
+def lookup():
+    """Look up record ids for a file by size and tagged fingerprint.
+
+    Answered from the snapshot; misses are checked against the database,
+    which also holds rows whose snapshot append never happened.
+    """
+    file_size = request.args.get('size', type=int)
+    fingerprint = request.args.get('fingerprint', '')
+    if file_size is None or ':' not in fingerprint:
+        abort(400, description="size and a tagged fingerprint are required")
+    snapshot = get_snapshot()
+    record_ids = snapshot.lookup(file_size, fingerprint)
+    source = 'snapshot'
+    if not record_ids:
+        record_ids = [record_id for (record_id,) in FileRecord.query
+                      .filter_by(file_size=file_size, fingerprint=fingerprint)
+                      .order_by(FileRecord.id)
+                      .with_entities(FileRecord.id)]
+        source = 'database'
+    return jsonify({
+        'generation': snapshot.generation,
+        'source': source,
+        'record_ids': record_ids,
+    })
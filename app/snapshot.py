@@ -0,0 +1,480 @@
+import bisect
+import logging
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+import time
+from array import array
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from app import db
+from app.hashing import FINGERPRINT_ALGORITHM, parse_fingerprint
+from app.models import FileRecord
+
+logger = logging.getLogger(__name__)
+
+# Snapshot file layout (fingerprints.<generation>.snap):
+#   header:  magic, algorithm, digest width, little-endian flag, generation, count
+#   sizes:   count x uint64, sorted
+#   digests: count x DIGEST_WIDTH bytes, sorted within each size
+#   ids:     count x uint64 record ids
+# Entries are sorted by (size, digest, id). Inserts made since the snapshot
+# was written live in fingerprints.<generation>.delta as fixed-width records
+# until the next compaction folds them into a new generation.
+# fingerprints.current names the generation readers should map. Appending
+# to a delta and publishing a generation both happen under
+# fingerprints.lock, so writers in any process always append to the
+# generation that is current.
+MAGIC = b'DDASSNP1'
+HEADER = struct.Struct('<8s16sIIQQ')
+DIGEST_WIDTH = 32
+DELTA_RECORD = struct.Struct(f'<Q{DIGEST_WIDTH}sQ')
+NATIVE_UINT64 = struct.Struct('=Q')
+WRITE_CHUNK = 65536
+
+def fingerprint_key(fingerprint):
+    """Fixed-width digest bytes for a tagged fingerprint."""
+    _, hexdigest = parse_fingerprint(fingerprint)
+    return bytes.fromhex(hexdigest)[:DIGEST_WIDTH].ljust(DIGEST_WIDTH, b'\0')
+
+def snapshot_path(directory, generation):
+    return os.path.join(directory, f"fingerprints.{generation}.snap")
+
+def delta_path(directory, generation):
+    return os.path.join(directory, f"fingerprints.{generation}.delta")
+
+def pointer_path(directory):
+    return os.path.join(directory, 'fingerprints.current')
+
+@contextmanager
+def writer_lock(directory):
+    """Exclusive cross-process lock held while appending to or publishing a generation."""
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, 'fingerprints.lock'), 'a+b') as f:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue  # LK_LOCK gives up after ~10 seconds; keep waiting
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+def read_generation(directory):
+    """Return the published generation, or None if no snapshot has been built."""
+    try:
+        with open(pointer_path(directory), 'r') as f:
+            return int(f.read().strip())
+    except (FileNotFoundError, ValueError):
+        return None
+
+def write_snapshot(path, generation, algorithm, entries):
+    """Write sorted (size, digest, id) entries as a snapshot file at ``path``.
+
+    The three sections are spooled to temporary files and concatenated, so
+    building a snapshot needs constant memory however many entries it holds.
+    """
+    directory = os.path.dirname(path)
+    count = 0
+    last = None
+    sizes, ids, digests = array('Q'), array('Q'), []
+    with tempfile.TemporaryFile(dir=directory) as sizes_file, \
+            tempfile.TemporaryFile(dir=directory) as digests_file, \
+            tempfile.TemporaryFile(dir=directory) as ids_file:
+        for entry in entries:
+            if last is not None and entry < last:
+                raise ValueError("Snapshot entries must be sorted by (size, digest, id)")
+            last = entry
+            sizes.append(entry[0])
+            digests.append(entry[1])
+            ids.append(entry[2])
+            count += 1
+            if len(sizes) >= WRITE_CHUNK:
+                sizes.tofile(sizes_file)
+                digests_file.write(b''.join(digests))
+                ids.tofile(ids_file)
+                sizes, ids, digests = array('Q'), array('Q'), []
+        sizes.tofile(sizes_file)
+        digests_file.write(b''.join(digests))
+        ids.tofile(ids_file)
+
+        with open(path, 'wb') as out:
+            out.write(HEADER.pack(MAGIC, algorithm.encode(), DIGEST_WIDTH,
+                                  sys.byteorder == 'little', generation, count))
+            for section in (sizes_file, digests_file, ids_file):
+                section.seek(0)
+                shutil.copyfileobj(section, out)
+    return count
+
+def write_merged_snapshot(path, generation, source, delta_entries):
+    """Write ``source`` with the sorted ``delta_entries`` spliced in at ``path``.
+
+    Each delta entry's position is found by binary search, and the snapshot
+    ranges between them are copied straight out of the mapping, so the cost
+    is a sequential copy plus O(delta * log n) work in Python rather than a
+    walk over every entry.
+    """
+    positions = [source.position(*entry) for entry in delta_entries]
+    pieces = (
+        (HEADER.size, 8, lambda entry: NATIVE_UINT64.pack(entry[0])),
+        (source.digest_offset, DIGEST_WIDTH, lambda entry: entry[1]),
+        (source.ids_offset, 8, lambda entry: NATIVE_UINT64.pack(entry[2])),
+    )
+    with open(path, 'wb') as out:
+        out.write(HEADER.pack(MAGIC, source.algorithm.encode(), DIGEST_WIDTH,
+                              sys.byteorder == 'little', generation,
+                              source.count + len(delta_entries)))
+        for section_offset, width, pack in pieces:
+            previous = 0
+            for position, entry in zip(positions, delta_entries):
+                source.copy_range(out, section_offset + previous * width, section_offset + position * width)
+                out.write(pack(entry))
+                previous = position
+            source.copy_range(out, section_offset + previous * width, section_offset + source.count * width)
+
+def replace_file(src, dst, attempts=50, delay=0.02):
+    """os.replace that retries while another process has ``dst`` open.
+
+    Windows refuses to replace a file that a reader has open without
+    delete sharing, and readers open fingerprints.current on every refresh.
+    They only hold it for a single read, so a short retry gets through.
+    """
+    for attempt in range(attempts):
+        try:
+            os.replace(src, dst)
+            return
+        except PermissionError:
+            if attempt == attempts - 1:
+                raise
+            time.sleep(delay)
+
+def remove_files(*paths):
+    """Delete whichever of ``paths`` exist, ignoring files that can't be removed."""
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def publish_generation(directory, generation):
+    """Point readers at ``generation``; call with writer_lock held."""
+    open(delta_path(directory, generation), 'ab').close()
+    tmp_path = f"{pointer_path(directory)}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(str(generation))
+    try:
+        replace_file(tmp_path, pointer_path(directory))
+    except OSError:
+        remove_files(tmp_path)
+        raise
+
+def remove_old_generations(directory, current):
+    """Delete files of generations older than ``current``."""
+    for name in os.listdir(directory):
+        parts = name.split('.')
+        if len(parts) != 3 or parts[0] != 'fingerprints' or parts[2] not in ('snap', 'delta'):
+            continue
+        if parts[1].isdigit() and int(parts[1]) < current:
+            # Still mapped by a reader on Windows if this fails; the next compaction retries
+            remove_files(os.path.join(directory, name))
+
+def build_snapshot_from_db(directory, algorithm=FINGERPRINT_ALGORITHM, yield_per=10000):
+    """Build and publish a fresh snapshot from every re-keyed FileRecord.
+
+    Rows are streamed from the database already in snapshot order. The
+    writer lock is held throughout so no append lands in a generation that
+    is about to be replaced.
+    """
+    rows = (db.session.query(FileRecord.file_size, FileRecord.fingerprint, FileRecord.id)
+            .filter(FileRecord.fingerprint.startswith(f"{algorithm}:"))
+            .order_by(FileRecord.file_size, FileRecord.fingerprint, FileRecord.id)
+            .execution_options(stream_results=True)
+            .yield_per(yield_per))
+    with writer_lock(directory):
+        previous = read_generation(directory)
+        generation = (previous or 0) + 1
+        path = snapshot_path(directory, generation)
+        try:
+            count = write_snapshot(f"{path}.tmp", generation, algorithm,
+                                   ((size, fingerprint_key(fingerprint), record_id)
+                                    for size, fingerprint, record_id in rows))
+            replace_file(f"{path}.tmp", path)
+            publish_generation(directory, generation)
+        except Exception:
+            # Readers still follow the previous pointer; drop the unpublished generation
+            remove_files(f"{path}.tmp", path, delta_path(directory, generation))
+            raise
+    remove_old_generations(directory, generation)
+    return count
+
+class SnapshotFile:
+    """One snapshot generation mapped read-only, searched in place."""
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, algorithm, width, little_endian, generation, count = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or width != DIGEST_WIDTH or bool(little_endian) != (sys.byteorder == 'little'):
+            self.mm.close()
+            self.file.close()
+            raise ValueError(f"Incompatible fingerprint snapshot: {path}")
+        self.algorithm = algorithm.rstrip(b'\0').decode()
+        self.generation = generation
+        self.count = count
+        self.view = memoryview(self.mm)
+        self.digest_offset = HEADER.size + 8 * count
+        self.ids_offset = self.digest_offset + DIGEST_WIDTH * count
+        self.sizes = self.view[HEADER.size:self.digest_offset].cast('Q')
+        self.ids = self.view[self.ids_offset:self.ids_offset + 8 * count].cast('Q')
+
+    def digest_at(self, index):
+        start = self.digest_offset + index * DIGEST_WIDTH
+        return self.mm[start:start + DIGEST_WIDTH]
+
+    def search(self, size, digest):
+        """Return the [first, last) index range of entries matching (size, digest)."""
+        lo = bisect.bisect_left(self.sizes, size)
+        end = bisect.bisect_right(self.sizes, size, lo)
+        hi = end
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.digest_at(mid) < digest:
+                lo = mid + 1
+            else:
+                hi = mid
+        first, hi = lo, end
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.digest_at(mid) <= digest:
+                lo = mid + 1
+            else:
+                hi = mid
+        return first, lo
+
+    def position(self, size, digest, record_id):
+        """Index at which (size, digest, record_id) would be inserted, after equal entries."""
+        first, last = self.search(size, digest)
+        return bisect.bisect_right(self.ids, record_id, first, last)
+
+    def lookup(self, size, digest):
+        first, last = self.search(size, digest)
+        return [self.ids[index] for index in range(first, last)]
+
+    def copy_range(self, out, start, end):
+        with self.view[start:end] as chunk:
+            out.write(chunk)
+
+    def close(self):
+        # Exported buffers must be released before the mapping can be closed
+        self.sizes.release()
+        self.ids.release()
+        self.view.release()
+        self.mm.close()
+        self.file.close()
+
+class FingerprintSnapshot:
+    """Read-mostly view of the fingerprint index shared by every process on the host.
+
+    The snapshot is mapped read-only, so opening it is instant and its pages
+    are shared through the OS page cache no matter how many processes map
+    it. Lookups binary-search the mapped arrays in place, then check the
+    small in-memory copy of the delta log.
+    """
+
+    def __init__(self, directory, refresh_interval=1.0, compact_threshold=10000):
+        self.directory = directory
+        self.refresh_interval = refresh_interval
+        self.compact_threshold = compact_threshold
+        self.lock = threading.RLock()
+        self.generation = None
+        self.current = None
+        self.delta = {}
+        self.delta_count = 0
+        self.delta_offset = 0
+        self.last_refresh = 0.0
+        self.compaction_thread = None
+        self.refresh(force=True)
+
+    @classmethod
+    def from_config(cls, app):
+        return cls(app.config['SNAPSHOT_DIR'],
+                   compact_threshold=app.config['SNAPSHOT_COMPACT_THRESHOLD'])
+
+    @property
+    def algorithm(self):
+        return self.current.algorithm if self.current else FINGERPRINT_ALGORITHM
+
+    @property
+    def count(self):
+        return self.current.count if self.current else 0
+
+    def open_generation(self, generation):
+        if self.current is not None:
+            self.current.close()
+            self.current = None
+        self.delta, self.delta_count, self.delta_offset = {}, 0, 0
+        self.generation = generation
+        if generation is not None:
+            self.current = SnapshotFile(snapshot_path(self.directory, generation))
+
+    def refresh(self, force=False):
+        """Pick up a newly published generation and any new delta records."""
+        with self.lock:
+            now = time.monotonic()
+            if not force and now - self.last_refresh < self.refresh_interval:
+                return
+            self.last_refresh = now
+            generation = read_generation(self.directory)
+            if generation != self.generation:
+                self.open_generation(generation)
+            if self.generation is None:
+                return
+            try:
+                with open(delta_path(self.directory, self.generation), 'rb') as f:
+                    f.seek(self.delta_offset)
+                    data = f.read()
+            except FileNotFoundError:
+                return
+            # Only consume whole records; a partially written one is read next time
+            usable = len(data) - len(data) % DELTA_RECORD.size
+            for size, digest, record_id in DELTA_RECORD.iter_unpack(data[:usable]):
+                self.delta.setdefault((size, digest), []).append(record_id)
+                self.delta_count += 1
+            self.delta_offset += usable
+
+    def lookup(self, file_size, fingerprint):
+        """Return the record ids stored for (file_size, fingerprint), snapshot entries first.
+
+        A miss is only reported after re-reading the pointer and delta log,
+        so callers can trust it without waiting out the refresh interval.
+        """
+        algorithm, _ = parse_fingerprint(fingerprint)
+        digest = fingerprint_key(fingerprint)
+        self.refresh()
+        with self.lock:
+            record_ids = self.lookup_current(algorithm, file_size, digest)
+            if not record_ids:
+                self.refresh(force=True)
+                record_ids = self.lookup_current(algorithm, file_size, digest)
+            return record_ids
+
+    def lookup_current(self, algorithm, file_size, digest):
+        if self.current is None or algorithm != self.current.algorithm:
+            return []
+        record_ids = self.current.lookup(file_size, digest)
+        for record_id in self.delta.get((file_size, digest), []):
+            if record_id not in record_ids:
+                record_ids.append(record_id)
+        return record_ids
+
+    def append(self, file_size, fingerprint, record_id):
+        """Record a new insert in the current generation's delta log.
+
+        Skipped while no snapshot has been published: the row is in the
+        database and the first build picks it up.
+        """
+        algorithm, _ = parse_fingerprint(fingerprint)
+        with self.lock, writer_lock(self.directory):
+            # Re-read the pointer under the lock so a concurrent compaction
+            # can't leave this record in a retired generation's delta
+            self.refresh(force=True)
+            if self.current is None or algorithm != self.current.algorithm:
+                return
+            with open(delta_path(self.directory, self.generation), 'ab') as f:
+                f.write(DELTA_RECORD.pack(file_size, fingerprint_key(fingerprint), record_id))
+            self.refresh(force=True)
+
+    def maybe_compact(self):
+        """Start a background compaction once the delta log passes the threshold."""
+        if self.delta_count < self.compact_threshold:
+            return
+        if self.compaction_thread and self.compaction_thread.is_alive():
+            return
+        self.compaction_thread = threading.Thread(target=self.compact_quietly,
+                                                  name='snapshot-compaction', daemon=True)
+        self.compaction_thread.start()
+
+    def compact_quietly(self):
+        try:
+            self.compact()
+        except Exception as e:
+            logger.error(f"Error compacting fingerprint snapshot: {str(e)}")
+
+    def compact(self):
+        """Merge the delta log into a new snapshot generation and publish it.
+
+        The merge works from its own mapping without holding any lock, so
+        lookups and appends carry on meanwhile. Only the carry-over of late
+        appends and the pointer swap run under the writer lock.
+        """
+        with self.lock:
+            self.refresh(force=True)
+            if self.generation is None or not self.delta_count:
+                return
+            old_generation = self.generation
+            consumed = self.delta_offset
+            delta_entries = sorted((size, digest, record_id)
+                                   for (size, digest), record_ids in self.delta.items()
+                                   for record_id in record_ids)
+
+        new_generation = old_generation + 1
+        new_path = snapshot_path(self.directory, new_generation)
+        tmp_path = f"{new_path}.{os.getpid()}.tmp"
+        source = SnapshotFile(snapshot_path(self.directory, old_generation))
+        try:
+            write_merged_snapshot(tmp_path, new_generation, source, delta_entries)
+        except Exception:
+            remove_files(tmp_path)
+            raise
+        finally:
+            source.close()
+
+        with writer_lock(self.directory):
+            if read_generation(self.directory) != old_generation:
+                # Another process published first; its generation already has our records
+                remove_files(tmp_path)
+                return
+            try:
+                replace_file(tmp_path, new_path)
+                # Carry over records appended since this compaction read the delta
+                with open(delta_path(self.directory, old_generation), 'rb') as f:
+                    f.seek(consumed)
+                    late = f.read()
+                with open(delta_path(self.directory, new_generation), 'wb') as f:
+                    f.write(late[:len(late) - len(late) % DELTA_RECORD.size])
+                publish_generation(self.directory, new_generation)
+            except Exception:
+                # Nothing points at the new generation yet, so the old one stays current
+                remove_files(tmp_path, new_path, delta_path(self.directory, new_generation))
+                raise
+
+        self.refresh(force=True)
+        remove_old_generations(self.directory, new_generation)
+        logger.info(f"Compacted fingerprint snapshot to generation {new_generation} "
+                    f"({source.count + len(delta_entries)} records)")
+
+    def close(self):
+        with self.lock:
+            if self.current is not None:
+                self.current.close()
+                self.current = None
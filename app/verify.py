@@ -0,0 +1,113 @@
+import logging
+import os
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+BLOCK_SIZE = 1024 * 1024  # 1MB reads keep syscalls few without holding much memory
+
+def file_identity(path):
+    """(path, inode, size, mtime) of a file; any change to the file changes its identity."""
+    st = os.stat(path)
+    return os.path.realpath(path), st.st_ino, st.st_size, st.st_mtime_ns
+
+def read_block(f, buffer, offset):
+    """Fill ``buffer`` from ``offset``; returns a view of the bytes actually read."""
+    f.seek(offset)
+    view = memoryview(buffer)
+    total = 0
+    while total < len(view):
+        count = f.readinto(view[total:])
+        if not count:
+            break
+        total += count
+    return view[:total]
+
+def compare_files(path_a, path_b, size, block_size=BLOCK_SIZE):
+    """Byte-compare two files of ``size`` bytes, stopping at the first difference.
+
+    The tail blocks are compared first: downloads that differ (truncated,
+    resumed or re-packed files) usually differ at the end, so most mismatches
+    are rejected after a single read. The rest is then compared front to
+    back in ``block_size`` reads.
+    """
+    buffer_a = bytearray(min(block_size, size))
+    buffer_b = bytearray(min(block_size, size))
+    with open(path_a, 'rb') as file_a, open(path_b, 'rb') as file_b:
+        tail_offset = max(0, size - block_size)
+        if read_block(file_a, buffer_a, tail_offset) != read_block(file_b, buffer_b, tail_offset):
+            return False
+        offset = 0
+        while offset < tail_offset:
+            block_a = read_block(file_a, buffer_a, offset)
+            block_b = read_block(file_b, buffer_b, offset)
+            if not block_a or block_a != block_b:
+                return False
+            offset += len(block_a)
+    return True
+
+class DuplicateVerifier:
+    """Confirms hash matches byte-for-byte before anything destructive happens.
+
+    Verified results are cached per unchanged original and candidate
+    content (sha256 fingerprint and size), so a repeat download of a file
+    that was already verified against the same original costs two stats
+    instead of a full read. The fingerprint is only trusted while the
+    candidate is unchanged since it was hashed.
+    """
+
+    def __init__(self, block_size=BLOCK_SIZE, cache_size=4096):
+        self.block_size = block_size
+        self.cache_size = cache_size
+        self.verified = OrderedDict()
+
+    def verify(self, candidate_path, original_path, fingerprint=None, hashed_identity=None):
+        """Return True only if both files exist, are distinct, and have identical contents.
+
+        ``fingerprint`` is the candidate's tagged fingerprint and
+        ``hashed_identity`` its file_identity() taken when it was hashed;
+        unless the candidate still has that identity, results are only
+        reused for the exact same candidate file.
+        """
+        try:
+            if os.path.samefile(candidate_path, original_path):
+                # Removing a file because it "duplicates" itself would lose the only copy
+                logger.warning(f"Refusing to treat {candidate_path} as a duplicate of itself")
+                return False
+            candidate = file_identity(candidate_path)
+            original = file_identity(original_path)
+        except OSError as e:
+            logger.warning(f"Cannot verify {os.path.basename(candidate_path)} against "
+                           f"{os.path.basename(original_path)}: {str(e)}")
+            return False
+
+        size = candidate[2]
+        if size != original[2]:
+            logger.warning(f"Hash match but sizes differ: {candidate_path} ({size} bytes) vs "
+                           f"{original_path} ({original[2]} bytes)")
+            return False
+
+        if fingerprint and hashed_identity == candidate:
+            key = (original, fingerprint, size)
+        else:
+            key = (original, candidate)
+        if key in self.verified:
+            self.verified.move_to_end(key)
+            logger.info(f"Duplicate already verified: {os.path.basename(candidate_path)}")
+            return True
+
+        try:
+            identical = size == 0 or compare_files(candidate_path, original_path, size, self.block_size)
+        except OSError as e:
+            logger.warning(f"Cannot verify {os.path.basename(candidate_path)}: {str(e)}")
+            return False
+
+        if not identical:
+            logger.warning(f"Hash match but contents differ: {candidate_path} vs {original_path}")
+            return False
+
+        self.verified[key] = True
+        if len(self.verified) > self.cache_size:
+            self.verified.popitem(last=False)
+        logger.info(f"Verified byte-for-byte duplicate: {os.path.basename(candidate_path)}")
+        return True
@@ -0,0 +1,93 @@
+import argparse
+import hashlib
+import multiprocessing
+import random
+import time
+from app.hashing import format_fingerprint
+from app.index_service import IndexClient, run_shard
+
+def simulate_host(host_id, shards, files, batch_size, shared_ratio, repeat_ratio, seed, results):
+    """Register ``files`` fingerprints in batches and record per-batch latency."""
+    rng = random.Random(seed)
+    client = IndexClient(shards, host_id=host_id)
+    seen = []
+    latencies = []
+    foreign = 0
+    for start in range(0, files, batch_size):
+        items = []
+        for n in range(start, min(start + batch_size, files)):
+            if seen and rng.random() < repeat_ratio:
+                # Re-download of something this host already saw
+                content = rng.choice(seen)
+            elif rng.random() < shared_ratio:
+                # Content drawn from a pool every host downloads from
+                content = f"shared-{rng.randrange(files)}"
+            else:
+                content = f"{host_id}-{n}"
+            seen.append(content)
+            digest = hashlib.sha256(content.encode()).hexdigest()
+            items.append({
+                'fingerprint': format_fingerprint('sha256', digest),
+                'file_path': f"/downloads/{content}-{n}",
+                'file_size': 1024,
+            })
+        began = time.perf_counter()
+        owners = client.lookup_insert(items)
+        latencies.append(time.perf_counter() - began)
+        foreign += sum(1 for item, owner in zip(items, owners)
+                       if client.is_foreign(owner, item['file_path']))
+    client.close()
+    results.put((host_id, latencies, foreign, client.cache_hits, client.cache_misses))
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def run_benchmark(hosts, shard_count, files, batch_size, shared_ratio, repeat_ratio, base_port):
+    shards = [('127.0.0.1', base_port + i) for i in range(shard_count)]
+    servers = [multiprocessing.Process(target=run_shard, args=(host, port), daemon=True)
+               for host, port in shards]
+    for server in servers:
+        server.start()
+    time.sleep(0.5)  # Let the shards bind
+
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=simulate_host,
+                                       args=(f"host-{i}", shards, files, batch_size,
+                                             shared_ratio, repeat_ratio, i, results))
+               for i in range(hosts)]
+    began = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    collected = [results.get() for _ in workers]
+    elapsed = time.perf_counter() - began
+    for worker in workers:
+        worker.join()
+    for server in servers:
+        server.terminate()
+
+    latencies = [latency for _, host_latencies, _, _, _ in collected for latency in host_latencies]
+    hits = sum(r[3] for r in collected)
+    misses = sum(r[4] for r in collected)
+    total = hosts * files
+    print(f"hosts={hosts} shards={shard_count} files/host={files} batch={batch_size}")
+    print(f"throughput: {total / elapsed:,.0f} lookups/s ({elapsed:.2f}s total)")
+    print(f"batch latency: p50={percentile(latencies, 0.50) * 1000:.2f}ms "
+          f"p95={percentile(latencies, 0.95) * 1000:.2f}ms "
+          f"p99={percentile(latencies, 0.99) * 1000:.2f}ms")
+    print(f"local cache hit rate: {hits / max(1, hits + misses):.1%}")
+    for host_id, _, foreign, _, _ in sorted(collected):
+        print(f"{host_id}: {foreign} duplicates detected")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the shared duplicate index with simulated hosts")
+    parser.add_argument('--hosts', type=int, default=4)
+    parser.add_argument('--shards', type=int, default=2)
+    parser.add_argument('--files', type=int, default=20000, help="files per host")
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--shared-ratio', type=float, default=0.2)
+    parser.add_argument('--repeat-ratio', type=float, default=0.1)
+    parser.add_argument('--base-port', type=int, default=7100)
+    args = parser.parse_args()
+    run_benchmark(args.hosts, args.shards, args.files, args.batch_size,
+                  args.shared_ratio, args.repeat_ratio, args.base_port)
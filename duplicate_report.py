@@ -0,0 +1,29 @@
+import argparse
+import sys
+from app import create_app
+from app.reports import REPORT_FORMATS, iter_duplicate_groups, rebuild_duplicate_groups
+
+def export_duplicate_report(fmt, output, min_count=2, limit=None):
+    """Write duplicate groups ranked by wasted bytes to ``output`` as they are read."""
+    render, _ = REPORT_FORMATS[fmt]
+    for chunk in render(iter_duplicate_groups(min_count=min_count, limit=limit)):
+        output.write(chunk)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export duplicate file groups ranked by wasted space")
+    parser.add_argument('--format', choices=sorted(REPORT_FORMATS), default='csv')
+    parser.add_argument('--output', help="file to write to (default: stdout)")
+    parser.add_argument('--min-count', type=int, default=2, help="minimum copies for a group to be listed")
+    parser.add_argument('--limit', type=int, help="only export the top N groups")
+    parser.add_argument('--rebuild', action='store_true', help="recompute cached aggregates before exporting")
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        if args.rebuild:
+            rebuild_duplicate_groups()
+        if args.output:
+            with open(args.output, 'w', newline='') as f:
+                export_duplicate_report(args.format, f, args.min_count, args.limit)
+        else:
+            export_duplicate_report(args.format, sys.stdout, args.min_count, args.limit)
@@ -2,9 +2,14 @@ import os
 import time
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
-from app.hashing import generate_checksum
+from app.hashing import generate_checksums
 from app.models import FileRecord
 from app import db, create_app
+from app.rekey import start_rekey_thread
+from app.polling import ScandirPollingObserver
+from app.index_service import IndexClient
+from app.verify import DuplicateVerifier, file_identity
+from app.snapshot import FingerprintSnapshot, build_snapshot_from_db
 import tkinter as tk
 from tkinter import messagebox
 from collections import defaultdict
@@ -247,8 +252,13 @@ class FileTracker:
                 self.remove_file(file_path)
 
 class FileHandler(FileSystemEventHandler):
-    def __init__(self, app):
+    def __init__(self, app, index_client=None, snapshot=None):
         self.app = app
+        self.index_client = index_client  # Shared index across monitor hosts, if configured
+        self.unregistered = {}  # Registrations the shared index couldn't take yet, by file path
+        self.last_registration_retry = datetime.now()
+        self.snapshot = snapshot  # Memory-mapped fingerprint index; the monitor owns its compaction
+        self.verifier = DuplicateVerifier()  # Byte-level check before any destructive action
         self.file_tracker = FileTracker()
         self.pending_files = set()
         self.processed_files = set()  # Keep track of processed files
@@ -286,28 +296,28 @@ class FileHandler(FileSystemEventHandler):
 
             # Generate checksum
             logger.info(f"Generating checksum for: {os.path.basename(file_path)}")
-            checksum = generate_checksum(file_path)
+            # Taken before hashing so any later change to the file invalidates the fingerprint
+            hashed_identity = file_identity(file_path)
+            checksum, fingerprint = generate_checksums(file_path)
             if checksum is None:
                 logger.error(f"Failed to generate checksum for: {file_path}")
                 return
 
             # Database operations
             with self.app.app_context():
-                existing_file = FileRecord.query.filter_by(checksum=checksum).first()
+                existing_file = self.find_in_snapshot(file_path, fingerprint, file_size)
+                if existing_file is None:
+                    # The snapshot only holds re-keyed rows, and an append can be lost
+                    # after its commit; legacy-checksum rows are only found in the database
+                    existing_file = FileRecord.find_duplicate(checksum, fingerprint, exclude_path=file_path)
                 if existing_file:
                     logger.info(f"Duplicate file detected: {file_path} matches {existing_file.file_path}")
-                    self.prompt_user(file_path, existing_file.file_path)
-                else:
-                    new_file = FileRecord(
-                        checksum=checksum,
-                        file_name=os.path.basename(file_path),
-                        file_path=file_path,
-                        file_size=file_size,
-                        file_type=os.path.splitext(file_path)[1]
-                    )
-                    db.session.add(new_file)
-                    db.session.commit()
-                    logger.info(f"Successfully added to database: {file_path}")
+                    self.prompt_user(file_path, existing_file.file_path, fingerprint, hashed_identity)
+                    if os.path.exists(file_path):
+                        # Kept duplicates are recorded so they show up in the duplicate report
+                        self.record_file(file_path, checksum, fingerprint, file_size)
+                elif self.record_file(file_path, checksum, fingerprint, file_size):
+                    self.check_shared_index(file_path, fingerprint, file_size)
 
             # Mark as processed
             self.processed_files.add(file_path)
@@ -317,6 +327,74 @@ class FileHandler(FileSystemEventHandler):
         finally:
             self.cleanup_file(file_path)
 
+    def record_file(self, file_path, checksum, fingerprint, file_size):
+        """Add a FileRecord for this file unless it is already recorded; returns True if added."""
+        if FileRecord.query.filter_by(file_path=file_path, checksum=checksum).first():
+            logger.info(f"File already recorded: {file_path}")
+            return False
+        new_file = FileRecord(
+            checksum=checksum,
+            fingerprint=fingerprint,
+            file_name=os.path.basename(file_path),
+            file_path=file_path,
+            file_size=file_size,
+            file_type=os.path.splitext(file_path)[1]
+        )
+        db.session.add(new_file)
+        db.session.flush()
+        record_id = new_file.id
+        db.session.commit()
+        logger.info(f"Successfully added to database: {file_path}")
+        if self.snapshot:
+            self.snapshot.append(file_size, fingerprint, record_id)
+        return True
+
+    def find_in_snapshot(self, file_path, fingerprint, file_size):
+        """Resolve a duplicate through the fingerprint snapshot."""
+        if self.snapshot is None:
+            return None
+        for record_id in self.snapshot.lookup(file_size, fingerprint):
+            record = db.session.get(FileRecord, record_id)
+            # Ids of deleted or rewritten rows can linger until the next rebuild
+            if record and record.fingerprint == fingerprint and record.file_path != file_path:
+                return record
+        return None
+
+    def check_shared_index(self, file_path, fingerprint, file_size):
+        """Register a new file with the shared index and report copies held by other hosts."""
+        if self.index_client is None:
+            return
+        self.register_with_shared_index([{
+            'fingerprint': fingerprint,
+            'file_path': file_path,
+            'file_size': file_size,
+        }])
+
+    def register_with_shared_index(self, items):
+        """Register files with the shared index, queueing them for a later retry if it is unreachable."""
+        try:
+            owners = self.index_client.lookup_insert(items)
+        except Exception as e:
+            logger.warning(f"Shared index unavailable, will retry {len(items)} registrations: {str(e)}")
+            for item in items:
+                self.unregistered[item['file_path']] = item
+            return False
+        for item, owner in zip(items, owners):
+            if self.index_client.is_foreign(owner, item['file_path']):
+                logger.info(f"Duplicate file detected on {owner['host']}: {item['file_path']} matches {owner['file_path']}")
+        return True
+
+    def retry_registrations(self, interval_seconds=60):
+        """Retry queued shared-index registrations, at most once per interval."""
+        current_time = datetime.now()
+        if not self.unregistered or (current_time - self.last_registration_retry).total_seconds() < interval_seconds:
+            return
+        self.last_registration_retry = current_time
+        items = list(self.unregistered.values())
+        self.unregistered = {}
+        if self.register_with_shared_index(items):
+            logger.info(f"Registered {len(items)} queued files with the shared index")
+
     def cleanup_file(self, file_path):
         """Clean up tracking for a file."""
         self.file_tracker.remove_file(file_path)
@@ -333,6 +411,16 @@ class FileHandler(FileSystemEventHandler):
             if len(self.processed_files) > 1000:
                 self.processed_files = set(list(self.processed_files)[-500:])
             self.last_cleanup = current_time
+
+        # Fold recent inserts into a new snapshot generation in the background once the delta log grows
+        if self.snapshot:
+            try:
+                self.snapshot.maybe_compact()
+            except Exception as e:
+                logger.error(f"Error compacting fingerprint snapshot: {str(e)}")
+
+        # Registrations made while the shared index was down
+        self.retry_registrations()
             
         # Then check pending files
         for file_path in list(self.pending_files):
@@ -410,12 +498,22 @@ class FileHandler(FileSystemEventHandler):
                 self.pending_files.add(dest_path)
                 logger.info(f"Added completed download to pending: {os.path.basename(dest_path)}")
 
-    def prompt_user(self, file_path, existing_path):
+    def prompt_user(self, file_path, existing_path, fingerprint=None, hashed_identity=None):
         def on_keep():
             root.destroy()
             logger.info(f"User chose to keep duplicate file: {file_path}")
 
         def on_delete():
+            # A hash match alone never justifies removing a file
+            if not self.verifier.verify(file_path, existing_path, fingerprint, hashed_identity):
+                logger.warning(f"Not deleting {file_path}: contents not verified identical to {existing_path}")
+                messagebox.showwarning("File Not Deleted",
+                                       f"{os.path.basename(file_path)} was not deleted.\n"
+                                       f"Its contents could not be verified identical to "
+                                       f"{os.path.basename(existing_path)}.",
+                                       parent=root)
+                root.destroy()
+                return
             try:
                 os.remove(file_path)
                 logger.info(f"User chose to delete duplicate file: {file_path}")
@@ -432,21 +530,36 @@ class FileHandler(FileSystemEventHandler):
                                       "Do you want to delete it?",
                                       icon='warning')
         if result == 'yes':
-            on_keep()
-        else:
             on_delete()
+        else:
+            on_keep()
 
 def start_observer():
     app = create_app()
     path_to_watch = r"C:\Users\aakas\Downloads"
-    event_handler = FileHandler(app)
-    observer = Observer()
+    snapshot = FingerprintSnapshot.from_config(app)
+    if snapshot.generation is None:
+        with app.app_context():
+            count = build_snapshot_from_db(app.config['SNAPSHOT_DIR'])
+        snapshot.refresh(force=True)
+        logger.info(f"Built fingerprint snapshot with {count} records")
+    event_handler = FileHandler(app, IndexClient.from_config(app), snapshot)
+    if app.config['MONITOR_POLLING']:
+        # Network mounts don't deliver native change notifications
+        observer = ScandirPollingObserver(
+            min_interval=app.config['POLLING_MIN_INTERVAL'],
+            max_interval=app.config['POLLING_MAX_INTERVAL'],
+        )
+    else:
+        observer = Observer()
     observer.schedule(event_handler, path=path_to_watch, recursive=False)
     observer.start()
+    rekey = start_rekey_thread(app, snapshot) if app.config['REKEY_ENABLED'] else None
 
     logger.info(f"Started file monitoring in: {path_to_watch}")
     logger.info("Monitoring configuration:")
     logger.info(f"- Path: {path_to_watch}")
+    logger.info(f"- Mode: {'scandir polling' if app.config['MONITOR_POLLING'] else 'native events'}")
     logger.info("- Monitoring for all file types")
     logger.info("- Detailed logging enabled")
 
@@ -456,6 +569,8 @@ def start_observer():
             time.sleep(1)
     except KeyboardInterrupt:
         observer.stop()
+        if rekey:
+            rekey.stop()
         logger.info("File monitoring stopped by user")
     observer.join()
 
@@ -0,0 +1,13 @@
+import argparse
+import logging
+from app.index_service import run_shard
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run one shard of the shared duplicate index")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=7100)
+    parser.add_argument('--log', help="append-only log used to persist the shard across restarts")
+    args = parser.parse_args()
+    run_shard(args.host, args.port, args.log)
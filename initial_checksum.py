@@ -1,26 +1,107 @@
 import os
-from app.hashing import generate_checksum
+from app.hashing import generate_checksums
 from app.models import FileRecord
 from app import db, create_app
+from app.index_service import IndexClient
+from app.snapshot import FingerprintSnapshot, build_snapshot_from_db
 
-def generate_initial_checksums(directory):
+def register_with_shared_index(index_client, items):
+    """Register a batch of files with the shared index and report fleet duplicates.
+
+    Returns False if the index could not be reached so the caller can keep
+    the batch and retry it with the next one.
+    """
+    try:
+        owners = index_client.lookup_insert(items)
+    except Exception as e:
+        print(f"Shared index unavailable, will retry {len(items)} files: {e}")
+        return False
+    for item, owner in zip(items, owners):
+        if index_client.is_foreign(owner, item['file_path']):
+            print(f"Duplicate of {owner['file_path']} on {owner['host']}: {item['file_path']}")
+    return True
+
+def backfill_shared_index(index_client, batch_size=500):
+    """Register every fingerprinted FileRecord with the shared index, in id order.
+
+    Registration is idempotent, so rows that are already registered cost
+    only a lookup. Stops at the first batch the index can't take; running
+    it again picks the remaining rows up.
+    """
+    last_id = 0
+    registered = 0
+    while True:
+        rows = (FileRecord.query
+                .filter(FileRecord.id > last_id)
+                .filter(FileRecord.fingerprint.isnot(None))
+                .order_by(FileRecord.id)
+                .limit(batch_size)
+                .with_entities(FileRecord.id, FileRecord.fingerprint,
+                               FileRecord.file_path, FileRecord.file_size)
+                .all())
+        if not rows:
+            break
+        items = [{'fingerprint': fingerprint, 'file_path': file_path, 'file_size': file_size}
+                 for _, fingerprint, file_path, file_size in rows]
+        if not register_with_shared_index(index_client, items):
+            print(f"Shared index backfill stopped after {registered} records; run again to finish")
+            return registered
+        registered += len(rows)
+        last_id = rows[-1][0]
+    print(f"Registered {registered} existing records with the shared index")
+    return registered
+
+def generate_initial_checksums(directory, batch_size=500):
     app = create_app()
+    index_client = IndexClient.from_config(app)
+    snapshot = FingerprintSnapshot.from_config(app)
+    pending = []
     with app.app_context():
+        if index_client:
+            # Files recorded before the shared index existed are skipped by the scan below
+            backfill_shared_index(index_client, batch_size)
         for root, _, files in os.walk(directory):
             for file in files:
                 file_path = os.path.join(root, file)
-                checksum = generate_checksum(file_path)
-                if not FileRecord.query.filter_by(checksum=checksum).first():
-                    new_file = FileRecord(
-                        checksum=checksum,
-                        file_name=file,
-                        file_path=file_path,
-                        file_size=os.path.getsize(file_path),
-                        file_type=os.path.splitext(file)[1]
-                    )
-                    db.session.add(new_file)
-                    db.session.commit()
-                    print(f"Checksum generated and stored for: {file_path}")
+                checksum, fingerprint = generate_checksums(file_path)
+                if checksum is None:
+                    continue
+                if FileRecord.query.filter_by(file_path=file_path, checksum=checksum).first():
+                    continue
+                existing_file = FileRecord.find_duplicate(checksum, fingerprint, exclude_path=file_path)
+                if existing_file:
+                    # Recorded anyway so the duplicate report sees every copy
+                    print(f"Duplicate of {existing_file.file_path}: {file_path}")
+                file_size = os.path.getsize(file_path)
+                new_file = FileRecord(
+                    checksum=checksum,
+                    fingerprint=fingerprint,
+                    file_name=file,
+                    file_path=file_path,
+                    file_size=file_size,
+                    file_type=os.path.splitext(file)[1]
+                )
+                db.session.add(new_file)
+                db.session.flush()
+                record_id = new_file.id
+                db.session.commit()
+                snapshot.append(file_size, fingerprint, record_id)
+                print(f"Checksum generated and stored for: {file_path}")
+                if index_client and not existing_file:
+                    pending.append({
+                        'fingerprint': fingerprint,
+                        'file_path': file_path,
+                        'file_size': file_size,
+                    })
+                    if len(pending) % batch_size == 0 and register_with_shared_index(index_client, pending):
+                        pending = []
+        if pending and not register_with_shared_index(index_client, pending):
+            print(f"{len(pending)} files were stored but not registered with the shared index")
+        snapshot.refresh(force=True)
+        if snapshot.generation is None:
+            # First run: publish a snapshot so other processes can map it
+            count = build_snapshot_from_db(app.config['SNAPSHOT_DIR'])
+            print(f"Fingerprint snapshot built with {count} records")
 
 if __name__ == "__main__":
     directory_to_scan = r"C:\Users\aakas\Downloads"
@@ -0,0 +1,22 @@
+import logging
+import sys
+from app import create_app
+from app.rekey import RekeyMigration
+from app.snapshot import FingerprintSnapshot
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def rekey_checksums():
+    """Run the fingerprint rekey in the foreground; safe to interrupt and re-run."""
+    app = create_app()
+    # Rekeyed rows are appended to the shared snapshot so it stays complete
+    migration = RekeyMigration.from_config(app, FingerprintSnapshot.from_config(app))
+    try:
+        migration.run()
+    except KeyboardInterrupt:
+        migration.stop()
+        print(f"Rekey interrupted, progress saved at record id {migration.checkpoint['last_id']}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    rekey_checksums()
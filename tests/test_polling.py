@@ -0,0 +1,147 @@
+import os
+import tempfile
+import unittest
+from array import array
+
+from app.polling import DirectorySnapshot, ScandirPollingObserver
+
+class RecordingHandler:
+    def __init__(self):
+        self.events = []
+
+    def dispatch(self, event):
+        if event.event_type == 'moved':
+            self.events.append(('moved', event.src_path, event.dest_path))
+        else:
+            self.events.append((event.event_type, event.src_path))
+
+def make_snapshot(entries):
+    """DirectorySnapshot from (name, inode, size, mtime) tuples."""
+    snapshot = DirectorySnapshot()
+    for name, inode, size, mtime in sorted(entries):
+        snapshot.names.append(name)
+        snapshot.inodes.append(inode)
+        snapshot.sizes.append(size)
+        snapshot.mtimes.append(mtime)
+    return snapshot
+
+class DirectorySnapshotTest(unittest.TestCase):
+    def test_diff_reports_created_deleted_and_modified(self):
+        old = make_snapshot([('a', 1, 10, 100), ('b', 2, 10, 100), ('c', 3, 10, 100)])
+        new = make_snapshot([('a', 1, 10, 100), ('b', 2, 20, 200), ('d', 4, 10, 100)])
+        self.assertEqual(old.diff(new), ([('d', 4)], [('c', 3)], ['b']))
+
+    def test_same_name_with_new_inode_is_a_replacement(self):
+        old = make_snapshot([('report.pdf', 1, 10, 100)])
+        new = make_snapshot([('report.pdf', 2, 10, 100)])
+        self.assertEqual(old.diff(new), ([('report.pdf', 2)], [('report.pdf', 1)], []))
+
+    def test_entries_are_stored_in_typed_arrays(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, 'file'), 'wb') as f:
+                f.write(b'data')
+            os.mkdir(os.path.join(directory, 'sub'))
+            snapshot = DirectorySnapshot.scan(directory)
+        self.assertEqual(snapshot.names, ['file'])
+        self.assertIsInstance(snapshot.sizes, array)
+        self.assertEqual(list(snapshot.sizes), [4])
+        self.assertEqual(snapshot.subdirs, [os.path.join(directory, 'sub')])
+
+class ScandirPollingObserverTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.root = os.path.realpath(self.tmp.name)
+
+    def watch(self, recursive=False, min_interval=1.0, max_interval=30.0):
+        """Schedule a watch and take its baseline snapshot, as run() does."""
+        observer = ScandirPollingObserver(min_interval, max_interval)
+        handler = RecordingHandler()
+        observer.schedule(handler, self.root, recursive=recursive)
+        watch = observer.watches[0]
+        observer.poll_directory(watch, watch.directories[self.root], emit=False)
+        return observer, watch, handler
+
+    def poll(self, observer, watch):
+        """Run one cycle with every directory due."""
+        for state in watch.directories.values():
+            state.next_due = 0.0
+        observer.poll_cycle(watch)
+
+    def path(self, *parts):
+        return os.path.join(self.root, *parts)
+
+    def write(self, path, data):
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    def test_existing_files_are_not_reported(self):
+        self.write(self.path('existing'), b'data')
+        observer, watch, handler = self.watch()
+        self.poll(observer, watch)
+        self.assertEqual(handler.events, [])
+
+    def test_created_and_modified_files(self):
+        self.write(self.path('existing'), b'data')
+        observer, watch, handler = self.watch()
+        self.write(self.path('new'), b'data')
+        self.write(self.path('existing'), b'more data')
+        self.poll(observer, watch)
+        self.assertEqual(sorted(handler.events),
+                         [('created', self.path('new')), ('modified', self.path('existing'))])
+
+    def test_replaced_file_is_reported_as_created(self):
+        self.write(self.path('setup.exe'), b'old')
+        observer, watch, handler = self.watch()
+        self.write(self.path('setup.exe.tmp'), b'new')
+        os.replace(self.path('setup.exe.tmp'), self.path('setup.exe'))
+        self.poll(observer, watch)
+        self.assertEqual(handler.events, [('created', self.path('setup.exe'))])
+
+    def test_rename_within_one_cycle_is_a_move(self):
+        self.write(self.path('movie.mkv.part'), b'data')
+        observer, watch, handler = self.watch()
+        os.rename(self.path('movie.mkv.part'), self.path('movie.mkv'))
+        self.poll(observer, watch)
+        self.assertEqual(handler.events, [('moved', self.path('movie.mkv.part'), self.path('movie.mkv'))])
+
+    def test_rename_across_directories_is_a_move(self):
+        os.mkdir(self.path('sub'))
+        self.write(self.path('file'), b'data')
+        observer, watch, handler = self.watch(recursive=True)
+        os.rename(self.path('file'), self.path('sub', 'file'))
+        self.poll(observer, watch)
+        self.assertEqual(handler.events, [('moved', self.path('file'), self.path('sub', 'file'))])
+
+    def test_new_subdirectory_contents_are_created_on_the_next_cycle(self):
+        observer, watch, handler = self.watch(recursive=True)
+        os.mkdir(self.path('sub'))
+        self.write(self.path('sub', 'file'), b'data')
+        self.poll(observer, watch)
+        self.assertIn(self.path('sub'), watch.directories)
+        self.assertEqual(handler.events, [])
+        self.poll(observer, watch)
+        self.assertEqual(handler.events, [('created', self.path('sub', 'file'))])
+
+    def test_quiet_directories_back_off_and_changes_reset_the_interval(self):
+        observer, watch, handler = self.watch(min_interval=1.0, max_interval=4.0)
+        state = watch.directories[self.root]
+        intervals = []
+        for _ in range(3):
+            self.poll(observer, watch)
+            intervals.append(state.interval)
+        self.assertEqual(intervals, [2.0, 4.0, 4.0])
+        self.write(self.path('new'), b'data')
+        self.poll(observer, watch)
+        self.assertEqual(state.interval, 1.0)
+
+    def test_directories_are_not_rescanned_before_they_are_due(self):
+        observer, watch, handler = self.watch(min_interval=60.0, max_interval=60.0)
+        self.write(self.path('new'), b'data')
+        observer.poll_cycle(watch)
+        self.assertEqual(handler.events, [])
+        self.poll(observer, watch)
+        self.assertEqual(handler.events, [('created', self.path('new'))])
+
+if __name__ == '__main__':
+    unittest.main()
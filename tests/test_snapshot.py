@@ -0,0 +1,181 @@
+import os
+import random
+import tempfile
+import unittest
+from unittest import mock
+
+from app import create_app, db, snapshot
+from app.models import FileRecord
+from app.snapshot import (FingerprintSnapshot, SnapshotFile, build_snapshot_from_db, fingerprint_key,
+                          publish_generation, read_generation, snapshot_path, write_snapshot, writer_lock)
+from config import Config
+
+def make_fingerprint(n):
+    return f"sha256:{n:064x}"
+
+class FingerprintSnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.directory = self.tmp.name
+
+    def build(self, entries):
+        """Publish generation 1 holding (size, fingerprint, id) entries."""
+        rows = sorted((size, fingerprint_key(fingerprint), record_id) for size, fingerprint, record_id in entries)
+        with writer_lock(self.directory):
+            write_snapshot(snapshot_path(self.directory, 1), 1, 'sha256', rows)
+            publish_generation(self.directory, 1)
+
+    def open_snapshot(self, **kwargs):
+        snap = FingerprintSnapshot(self.directory, **kwargs)
+        self.addCleanup(snap.close)
+        return snap
+
+    def test_lookup_finds_every_entry_and_nothing_else(self):
+        self.build([(10, make_fingerprint(1), 1), (10, make_fingerprint(2), 2),
+                    (10, make_fingerprint(1), 3), (20, make_fingerprint(1), 4)])
+        snap = self.open_snapshot()
+        self.assertEqual(snap.generation, 1)
+        self.assertEqual(snap.count, 4)
+        self.assertEqual(snap.lookup(10, make_fingerprint(1)), [1, 3])
+        self.assertEqual(snap.lookup(10, make_fingerprint(2)), [2])
+        self.assertEqual(snap.lookup(20, make_fingerprint(1)), [4])
+        self.assertEqual(snap.lookup(20, make_fingerprint(2)), [])
+        self.assertEqual(snap.lookup(10, f"md5:{'0' * 32}"), [])
+
+    def test_search_and_position_bracket_equal_entries(self):
+        self.build([(10, make_fingerprint(1), 5), (10, make_fingerprint(1), 7), (10, make_fingerprint(2), 1)])
+        source = SnapshotFile(snapshot_path(self.directory, 1))
+        self.addCleanup(source.close)
+        digest = fingerprint_key(make_fingerprint(1))
+        self.assertEqual(source.search(10, digest), (0, 2))
+        self.assertEqual(source.search(11, digest), (3, 3))
+        self.assertEqual(source.position(10, digest, 6), 1)
+        self.assertEqual(source.position(10, digest, 9), 2)
+        self.assertEqual(source.position(9, digest, 1), 0)
+
+    def test_append_is_seen_by_other_readers_on_their_next_lookup(self):
+        self.build([(10, make_fingerprint(1), 1)])
+        reader = self.open_snapshot(refresh_interval=3600)
+        writer = self.open_snapshot()
+        self.assertEqual(reader.lookup(30, make_fingerprint(3)), [])
+        writer.append(30, make_fingerprint(3), 9)
+        # A miss re-reads the delta instead of waiting out the refresh interval
+        self.assertEqual(reader.lookup(30, make_fingerprint(3)), [9])
+
+    def test_append_without_a_generation_is_skipped(self):
+        snap = self.open_snapshot()
+        snap.append(10, make_fingerprint(1), 1)
+        self.assertIsNone(snap.generation)
+        self.assertEqual(snap.lookup(10, make_fingerprint(1)), [])
+
+    def test_compaction_keeps_every_entry_in_order(self):
+        rng = random.Random(7)
+        entries = [(rng.randrange(50), make_fingerprint(rng.randrange(20)), record_id)
+                   for record_id in range(1, 201)]
+        self.build(entries[:80])
+        snap = self.open_snapshot()
+        for start in (80, 120, 160):
+            for size, fingerprint, record_id in entries[start:start + 40]:
+                snap.append(size, fingerprint, record_id)
+            snap.compact()
+        self.assertEqual(snap.generation, 4)
+        self.assertEqual(snap.delta_count, 0)
+        expected = {}
+        for size, fingerprint, record_id in entries:
+            expected.setdefault((size, fingerprint), set()).add(record_id)
+        for (size, fingerprint), record_ids in expected.items():
+            self.assertEqual(set(snap.lookup(size, fingerprint)), record_ids)
+        source = snap.current
+        keys = [(source.sizes[i], source.digest_at(i), source.ids[i]) for i in range(source.count)]
+        self.assertEqual(keys, sorted(keys))
+        self.assertEqual(sorted(os.listdir(self.directory)),
+                         ['fingerprints.4.delta', 'fingerprints.4.snap', 'fingerprints.current', 'fingerprints.lock'])
+
+    def test_appends_during_compaction_are_carried_over(self):
+        self.build([(10, make_fingerprint(1), 1)])
+        compactor = self.open_snapshot()
+        writer = self.open_snapshot()
+        compactor.append(20, make_fingerprint(2), 2)
+        merge = snapshot.write_merged_snapshot
+
+        def merge_with_late_append(*args):
+            merge(*args)
+            writer.append(30, make_fingerprint(3), 3)
+
+        with mock.patch.object(snapshot, 'write_merged_snapshot', merge_with_late_append):
+            compactor.compact()
+        self.assertEqual(read_generation(self.directory), 2)
+        self.assertEqual(compactor.count, 2)
+        self.assertEqual(compactor.delta_count, 1)
+        reader = self.open_snapshot()
+        for size, n in ((10, 1), (20, 2), (30, 3)):
+            self.assertEqual(reader.lookup(size, make_fingerprint(n)), [n])
+
+    def test_compaction_loses_to_an_earlier_publish(self):
+        self.build([(10, make_fingerprint(1), 1)])
+        first = self.open_snapshot()
+        second = self.open_snapshot()
+        first.append(20, make_fingerprint(2), 2)
+        second.refresh(force=True)
+        merge = snapshot.write_merged_snapshot
+        compacted = []
+
+        def merge_after_other_compaction(*args):
+            merge(*args)
+            if not compacted:
+                compacted.append(True)
+                first.compact()
+
+        with mock.patch.object(snapshot, 'write_merged_snapshot', merge_after_other_compaction):
+            second.compact()
+        self.assertEqual(read_generation(self.directory), 2)
+        self.assertFalse([name for name in os.listdir(self.directory) if name.endswith('.tmp')])
+        self.assertEqual(second.lookup(20, make_fingerprint(2)), [2])
+
+    def test_publish_retries_while_the_pointer_is_in_use(self):
+        self.build([(10, make_fingerprint(1), 1)])
+        replace = os.replace
+        attempts = []
+
+        def replace_in_use(src, dst):
+            attempts.append(dst)
+            if len(attempts) < 3:
+                raise PermissionError(13, 'The process cannot access the file')
+            replace(src, dst)
+
+        with writer_lock(self.directory), mock.patch.object(snapshot.os, 'replace', replace_in_use):
+            publish_generation(self.directory, 2)
+        self.assertEqual(len(attempts), 3)
+        self.assertEqual(read_generation(self.directory), 2)
+
+class BuildSnapshotFromDbTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        with mock.patch.object(Config, 'SQLALCHEMY_DATABASE_URI', 'sqlite://'):
+            self.app = create_app()
+        self.context = self.app.app_context()
+        self.context.push()
+        self.addCleanup(self.context.pop)
+        db.create_all()
+
+    def add(self, record_id, size, fingerprint):
+        db.session.add(FileRecord(id=record_id, checksum=f"c{record_id}", fingerprint=fingerprint,
+                                  file_name='file', file_path=f"/files/{record_id}",
+                                  file_size=size, file_type=''))
+
+    def test_build_holds_only_rekeyed_rows(self):
+        self.add(1, 10, make_fingerprint(1))
+        self.add(2, 10, None)
+        self.add(3, 10, make_fingerprint(1))
+        self.add(4, 5, make_fingerprint(2))
+        db.session.commit()
+        self.assertEqual(build_snapshot_from_db(self.tmp.name), 3)
+        snap = FingerprintSnapshot(self.tmp.name)
+        self.addCleanup(snap.close)
+        self.assertEqual(snap.lookup(10, make_fingerprint(1)), [1, 3])
+        self.assertEqual(snap.lookup(5, make_fingerprint(2)), [4])
+
+if __name__ == '__main__':
+    unittest.main()
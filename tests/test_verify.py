@@ -0,0 +1,85 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from app import verify
+from app.hashing import generate_checksum
+from app.verify import DuplicateVerifier
+
+# Two different 128-byte blocks with the same MD5 (Wang et al., 2004). Files
+# under 1MB are matched on MD5, so these are reported as duplicates by hash.
+MD5_COLLISION_A = bytes.fromhex(
+    'd131dd02c5e6eec4693d9a0698aff95c2fcab58712467eab4004583eb8fb7f89'
+    '55ad340609f4b30283e488832571415a085125e8f7cdc99fd91dbdf280373c5b'
+    'd8823e3156348f5bae6dacd436c919c6dd53e2b487da03fd02396306d248cda0'
+    'e99f33420f577ee8ce54b67080a80d1ec69821bcb6a8839396f9652b6ff72a70')
+MD5_COLLISION_B = bytes.fromhex(
+    'd131dd02c5e6eec4693d9a0698aff95c2fcab50712467eab4004583eb8fb7f89'
+    '55ad340609f4b30283e4888325f1415a085125e8f7cdc99fd91dbd7280373c5b'
+    'd8823e3156348f5bae6dacd436c919c6dd53e23487da03fd02396306d248cda0'
+    'e99f33420f577ee8ce54b67080280d1ec69821bcb6a8839396f965ab6ff72a70')
+
+class DuplicateVerifierTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def write(self, name, data):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def test_rejects_same_size_same_hash_different_content(self):
+        original = self.write('original.bin', MD5_COLLISION_A)
+        candidate = self.write('candidate.bin', MD5_COLLISION_B)
+        self.assertEqual(generate_checksum(original), generate_checksum(candidate))
+        self.assertFalse(DuplicateVerifier().verify(candidate, original))
+
+    def test_accepts_identical_copy(self):
+        data = os.urandom(3 * 1024 * 1024 + 17)
+        original = self.write('original.bin', data)
+        candidate = self.write('candidate.bin', data)
+        self.assertTrue(DuplicateVerifier(block_size=1024 * 1024).verify(candidate, original))
+
+    def test_tail_difference_is_rejected_with_a_single_read(self):
+        data = bytearray(os.urandom(8 * 4096))
+        original = self.write('original.bin', bytes(data))
+        data[-1] ^= 0xFF
+        candidate = self.write('candidate.bin', bytes(data))
+        with mock.patch.object(verify, 'read_block', wraps=verify.read_block) as read_block:
+            self.assertFalse(DuplicateVerifier(block_size=4096).verify(candidate, original))
+        # One tail read per file, no forward scan
+        self.assertEqual(read_block.call_count, 2)
+
+    def test_refuses_file_compared_with_itself(self):
+        path = self.write('original.bin', b'data')
+        self.assertFalse(DuplicateVerifier().verify(path, path))
+
+    def test_repeat_download_reuses_verification(self):
+        data = os.urandom(64 * 1024)
+        original = self.write('original.bin', data)
+        first = self.write('copy (1).bin', data)
+        second = self.write('copy (2).bin', data)
+        verifier = DuplicateVerifier()
+        self.assertTrue(verifier.verify(first, original, 'sha256:abc', verify.file_identity(first)))
+        with mock.patch.object(verify, 'compare_files') as compare_files:
+            self.assertTrue(verifier.verify(second, original, 'sha256:abc', verify.file_identity(second)))
+        compare_files.assert_not_called()
+
+    def test_candidate_changed_after_hashing_is_compared_again(self):
+        data = os.urandom(64 * 1024)
+        original = self.write('original.bin', data)
+        first = self.write('copy (1).bin', data)
+        second = self.write('copy (2).bin', data)
+        verifier = DuplicateVerifier()
+        self.assertTrue(verifier.verify(first, original, 'sha256:abc', verify.file_identity(first)))
+        hashed_identity = verify.file_identity(second)
+        with open(second, 'wb') as f:
+            f.write(os.urandom(len(data)))
+        os.utime(second, ns=(hashed_identity[3] + 1, hashed_identity[3] + 1))
+        self.assertFalse(verifier.verify(second, original, 'sha256:abc', hashed_identity))
+
+if __name__ == '__main__':
+    unittest.main()